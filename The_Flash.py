@@ -1,9 +1,30 @@
+import bisect
+import collections
+import datetime
+import dbm
+import lzma
+import os
+import pickle
 import shelve
+import sqlite3
+import struct
+import sys
 import time
+import zlib
 import tkinter
 import random
 from tkinter import ttk
 from tkinter import messagebox
+from array import array
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl, lock with msvcrt instead
+    fcntl = None
+    import msvcrt
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 
@@ -146,11 +167,14 @@ class APQ:
         if element._index == 0:  # If elt is in first index, use remove_min code
             ret_elt = self.remove_min()
             return ret_elt
-        else:  # Otherwise, swap with last elt and pop, Since last elt has to be biggest, it will always use bubble down
-            self.queue[element._index], self.queue[self.length() - 1] =  self.queue[self.length() - 1], self.queue[element._index]
-            self.queue[element._index]._index = element._index
-            self.bubble_down(element._index)
+        else:  # Otherwise, swap with last elt and pop, then move the swapped elt up or down as needed
+            index = element._index
+            self.queue[index], self.queue[self.length() - 1] =  self.queue[self.length() - 1], self.queue[index]
             removed_elt = self.queue.pop(self.length() - 1)
+            if index < self.length():
+                self.queue[index]._index = index
+                self.bubble_up(index)
+                self.bubble_down(index)
             return removed_elt
 
     def bubble_up(self, index):
@@ -192,6 +216,10 @@ class APQ:
 
 
 class Card:
+    """Single flashcard. Uses __slots__ so big decks don't carry a __dict__ per card, and interns
+    the text so a card and its reverse share the same strings even after unpickling"""
+    __slots__ = ("_l1", "_l2", "interval", "last_grade", "date_done", "due", "repetition", "easiness")
+    fields = ("l1", "l2", "interval", "last_grade", "date_done", "due", "repetition", "easiness")
 
     def __init__(self, l1 , l2):
         self.l1 = l1
@@ -199,9 +227,36 @@ class Card:
         self.interval = 0
         self.last_grade = None
         self.date_done = None
+        self.due = None # Timestamp of the next repetition, set when graded
         self.repetition = 0 # Number of times successfully recalled
         self.easiness = 2.5 # How fast interval grows
 
+    @property
+    def l1(self):
+        return self._l1
+
+    @l1.setter
+    def l1(self, value):
+        self._l1 = sys.intern(value)
+
+    @property
+    def l2(self):
+        return self._l2
+
+    @l2.setter
+    def l2(self, value):
+        self._l2 = sys.intern(value)
+
+    def __getstate__(self):
+        return {f: getattr(self, f) for f in self.fields}
+
+    def __setstate__(self, state):
+        # Decks pickled before __slots__ store a plain __dict__, which has the same keys
+        self.__init__(state["l1"], state["l2"])
+        for f in self.fields[2:]:
+            if f in state:
+                setattr(self, f, state[f])
+
     def opposite(self, label):
         if label == self.l1:
             return self.l2
@@ -211,30 +266,265 @@ class Card:
             return None
 
 
+class CardStore:
+    """Columnar card storage for very large decks. Text lives in two lists and the scheduling
+    fields in typed arrays, so a card costs a few bytes per field instead of a whole object"""
+
+    def __init__(self):
+        self.l1 = []
+        self.l2 = []
+        self.interval = array("d")
+        self.last_grade = array("b")  # -1 stands for None
+        self.date_done = array("d")   # -1 stands for None
+        self.due = array("d")         # -1 stands for None
+        self.repetition = array("i")
+        self.easiness = array("d")
+
+    def add(self, l1, l2):
+        """Append a new card to the store and return a StoredCard pointing at it"""
+        self.l1.append(sys.intern(l1))
+        self.l2.append(sys.intern(l2))
+        self.interval.append(0)
+        self.last_grade.append(-1)
+        self.date_done.append(-1)
+        self.due.append(-1)
+        self.repetition.append(0)
+        self.easiness.append(2.5)
+        return StoredCard(self, self.length() - 1)
+
+    def add_copy(self, card):
+        """Append a copy of any card, text and scheduling fields included"""
+        copy = self.add(card.l1, card.l2)
+        for f in Card.fields[2:]:
+            setattr(copy, f, getattr(card, f))
+        return copy
+
+    def length(self):
+        return len(self.l1)
+
+
+def _column(name, none_value=None):
+    """Property reading/writing one column of a CardStore for the card's index"""
+    def get(self):
+        value = getattr(self._store, name)[self._index]
+        if none_value is not None and value == none_value:
+            return None
+        return value
+
+    def set(self, value):
+        if value is None:
+            value = none_value
+        elif name in ("l1", "l2"):
+            value = sys.intern(value)
+        getattr(self._store, name)[self._index] = value
+    return property(get, set)
+
+
+class StoredCard:
+    """Card backed by a row of a CardStore. Has the same attributes as Card"""
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    l1 = _column("l1")
+    l2 = _column("l2")
+    interval = _column("interval")
+    last_grade = _column("last_grade", -1)
+    date_done = _column("date_done", -1)
+    due = _column("due", -1)
+    repetition = _column("repetition")
+    easiness = _column("easiness")
+
+    opposite = Card.opposite
+
+    def __reduce__(self):
+        # Half the pickling time of the default state dict, which matters when grades save a
+        # deck of a few hundred thousand cards
+        return StoredCard, (self._store, self._index)
+
+
+def day_of(timestamp):
+    """Return the local calendar day of a timestamp as a day number"""
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+def forecast_days(due_days, days=7):
+    """List of how many cards in the day buckets fall due on each of the next 'days' days,
+    today first. Cards already overdue are counted for today"""
+    today = datetime.date.today().toordinal()
+    counts = [0] * days
+    for d, n in due_days.items():
+        if d < today + days:
+            counts[max(d - today, 0)] += n
+    return counts
+
+
+def count_due(due_now, due_days, days=0):
+    """Cards due by the end of today plus 'days' days, given the cards already due and
+    the day buckets of the scheduled ones"""
+    last = datetime.date.today().toordinal() + days
+    return due_now + sum(n for d, n in due_days.items() if d <= last)
+
+
+class DeckStats:
+    """Running totals for a deck, updated on every grade and every card added or deleted,
+    so statistics never need a pass over the cards"""
+
+    def __init__(self):
+        self.grades = [0, 0, 0]  # Number of bad, medium and good grades given
+        self.cards = 0
+        self.easiness_total = 0.0
+        self.easiness = {}  # Easiness rounded to 0.1 -> number of cards
+
+    def add_card(self, card, sign=1):
+        self.cards += sign
+        self.easiness_total += sign * card.easiness
+        self._bucket(card.easiness, sign)
+
+    def remove_card(self, card):
+        self.add_card(card, -1)
+
+    def graded(self, grade, old_easiness, new_easiness, sign=1):
+        """Count a grade and move the card to its new easiness. sign=-1 takes it back"""
+        self.grades[grade] += sign
+        self.easiness_total += sign * (new_easiness - old_easiness)
+        self._bucket(old_easiness, -sign)
+        self._bucket(new_easiness, sign)
+
+    def _bucket(self, easiness, n):
+        key = round(easiness, 1)
+        self.easiness[key] = self.easiness.get(key, 0) + n
+        if self.easiness[key] == 0:
+            del self.easiness[key]
+
+    def retention(self):
+        """Share of grades that were medium or good, or None before any grade"""
+        total = sum(self.grades)
+        if total == 0:
+            return None
+        return (self.grades[1] + self.grades[2]) / total
+
+    def average_easiness(self):
+        if self.cards == 0:
+            return None
+        return self.easiness_total / self.cards
+
+
 class Deck:
+    store = None  # Decks pickled before columnar storage have no store
+    due_days = None  # Day number -> how many cards in all_repetitions are due that day
+    stats = None  # DeckStats, see statistics()
+    columnar_threshold = 10000  # Bigger decks are switched to columnar storage when saved
 
-    def __init__(self, name):
+    def __init__(self, name, columnar=False):
         self.name = name
         self.new = []
         self.fails = Queue()
         self.due_repetitions = []
         self.all_repetitions = APQ()
-
+        if columnar:
+            self.store = CardStore()
+
+    def new_card(self, l1, l2):
+        """Create a card for this deck, in the columnar store if the deck has one"""
+        if self.store is not None:
+            return self.store.add(l1, l2)
+        return Card(l1, l2)
+
+    def rebuild_store(self):
+        """Copy every card into a fresh CardStore. Converts the deck to columnar storage, or
+        drops the rows of deleted cards if it already was columnar"""
+        store = CardStore()
+        self.new[:] = [store.add_copy(c) for c in self.new]
+        self.fails.queue[:] = [store.add_copy(c) for c in self.fails.queue]
+        self.due_repetitions[:] = [store.add_copy(c) for c in self.due_repetitions]
+        for e in self.all_repetitions.queue:
+            e._value = store.add_copy(e._value)
+        self.store = store
+
+    def tidy_store(self):
+        """Called before saving: big decks become columnar and deleted rows are reclaimed"""
+        size = self.check_total_size()
+        if self.store is None:
+            if size > self.columnar_threshold:
+                self.rebuild_store()
+        elif self.store.length() > size:
+            self.rebuild_store()
+
+    def schedule(self, card, due=None):
+        """Add a graded card to all_repetitions, keyed by its due timestamp"""
+        if due is None:
+            due = card.due
+        buckets = self.buckets()
+        day = day_of(due)
+        buckets[day] = buckets.get(day, 0) + 1
+        return self.all_repetitions.add(due, card)
+
+    def unschedule(self, element):
+        """Remove an element of all_repetitions, e.g. when its card is deleted"""
+        self.all_repetitions.remove(element)
+        self._bucket_remove(element._key)
+        return element._value
+
+    def buckets(self):
+        if self.due_days is None:  # Built once for decks saved before the buckets existed
+            self.due_days = {}
+            for e in self.all_repetitions.queue:
+                day = day_of(e._key)
+                self.due_days[day] = self.due_days.get(day, 0) + 1
+        return self.due_days
+
+    def _bucket_remove(self, due):
+        buckets = self.buckets()
+        day = day_of(due)
+        buckets[day] -= 1
+        if buckets[day] == 0:
+            del buckets[day]
 
     def check_repetitions(self):
-        while True:
-            if self.all_repetitions.min()[1] == 0:
-                minimum = self.all_repetitions.remove_min()
-                self.due_repetitions.append(minimum[0])
-            else:
-                break
+        """Move every card whose due time has passed into due_repetitions"""
+        now = time.time()
+        while self.all_repetitions.length() > 0 and self.all_repetitions.min()[1] <= now:
+            minimum = self.all_repetitions.remove_min()
+            self._bucket_remove(minimum._key)
+            self.due_repetitions.append(minimum._value)
+
+    def due_count(self, days=0):
+        """Number of repetitions due by the end of today plus 'days' days.
+        Only looks at the day buckets, never at the cards"""
+        return count_due(len(self.due_repetitions), self.buckets(), days)
+
+    def forecast(self, days=7):
+        """List of how many scheduled cards fall due on each of the next 'days' days, today first"""
+        return forecast_days(self.buckets(), days)
+
+    def statistics(self):
+        if self.stats is None:  # Built once for decks saved before the statistics existed
+            self.stats = DeckStats()
+            for card in self.all_cards():
+                self.stats.add_card(card)
+                if card.last_grade is not None:
+                    self.stats.grades[card.last_grade] += 1
+        return self.stats
 
     def check_total_size(self):
         t = len(self.new) + len(self.fails.queue) + len(self.due_repetitions) + len(self.all_repetitions.queue)
         return t
 
+    def all_cards(self):
+        """Yield every card in the deck, in the order EditDeck lists them"""
+        yield from self.new
+        yield from self.fails.queue
+        yield from self.due_repetitions
+        for e in self.all_repetitions.queue:
+            yield e._value
+
 class IntervalAlgorithm:
 
+    day_length = 24 * 60 * 60
+
     def algo(self, card):
         if card.last_grade >= 1:  # correct response
             if card.repetition == 0:
@@ -250,31 +540,333 @@ class IntervalAlgorithm:
         else:  # incorrect response
             card.repetition = 0
             card.interval = 1
+        card.date_done = time.time()
+        card.due = card.date_done + card.interval * self.day_length
         return card
 
 
+def card_fields(card):
+    """Snapshot of the scheduling fields of a card, for undo"""
+    return tuple(getattr(card, f) for f in Card.fields[2:])
+
+
+def set_card_fields(card, values):
+    for f, v in zip(Card.fields[2:], values):
+        setattr(card, f, v)
+
+
+class FieldsStep:
+    """Change to the scheduling fields of a card"""
+
+    def __init__(self, card, before):
+        self.card = card
+        self.before = before
+        self.after = card_fields(card)
+
+    def undo(self):
+        set_card_fields(self.card, self.before)
+
+    def redo(self):
+        set_card_fields(self.card, self.after)
+
+
+class IndexStep:
+    """Change of the card shown by a card tab"""
+
+    def __init__(self, tab, before, after):
+        self.tab = tab
+        self.before = before
+        self.after = after
+
+    def undo(self):
+        self.tab.current_card_index = self.before
+
+    def redo(self):
+        self.tab.current_card_index = self.after
+
+
+def remove_card(lst, card):
+    """Remove 'card' itself from 'lst'. Returns False if it isn't there. Review tabs and
+    EditDeck change the same lists, so a card may have moved since a step was recorded"""
+    for i, c in enumerate(lst):
+        if c is card:
+            del lst[i]
+            return True
+    return False
+
+
+def contains_card(lst, card):
+    return any(c is card for c in lst)
+
+
+class ListRemoveStep:
+    """Removal of a card from position 'index' of a list. The owner, if any, is told about
+    cards leaving and coming back"""
+
+    def __init__(self, lst, index, card, owner=None):
+        self.lst = lst
+        self.index = index
+        self.card = card
+        self.owner = owner
+
+    def undo(self):
+        if contains_card(self.lst, self.card):
+            return
+        self.lst.insert(min(self.index, len(self.lst)), self.card)
+        if self.owner is not None:
+            self.owner.remember(self.card)
+
+    def redo(self):
+        if remove_card(self.lst, self.card) and self.owner is not None:
+            self.owner.forget(self.card)
+
+
+class ListAppendStep:
+    """Card appended to the end of a list"""
+
+    def __init__(self, lst, card, owner=None):
+        self.lst = lst
+        self.card = card
+        self.owner = owner
+
+    def undo(self):
+        if remove_card(self.lst, self.card) and self.owner is not None:
+            self.owner.forget(self.card)
+
+    def redo(self):
+        if contains_card(self.lst, self.card):
+            return
+        self.lst.append(self.card)
+        if self.owner is not None:
+            self.owner.remember(self.card)
+
+
+class TextStep:
+    """Change to the text of a card. The owner re-indexes the card"""
+
+    def __init__(self, card, old_l1, old_l2, owner):
+        self.card = card
+        self.texts = [(old_l1, old_l2), (card.l1, card.l2)]
+        self.owner = owner
+
+    def undo(self):
+        self._set(self.texts[0])
+
+    def redo(self):
+        self._set(self.texts[1])
+
+    def _set(self, texts):
+        old_l1, old_l2 = self.card.l1, self.card.l2
+        self.card.l1, self.card.l2 = texts
+        self.owner.retext(self.card, old_l1, old_l2)
+
+
+class ScheduleStep:
+    """Card added to the all_repetitions of a deck"""
+
+    def __init__(self, deck, element):
+        self.deck = deck
+        self.element = element
+        self.card = element._value
+        self.due = element._key
+
+    def undo(self):
+        self.deck.unschedule(self.element)
+
+    def redo(self):
+        self.element = self.deck.schedule(self.card, self.due)
+
+
+class UnscheduleStep(ScheduleStep):
+    """Card removed from the all_repetitions of a deck"""
+
+    def __init__(self, deck, element, owner=None):
+        super().__init__(deck, element)
+        self.owner = owner
+
+    def undo(self):
+        super().redo()
+        if self.owner is not None:
+            self.owner.remember(self.card)
+
+    def redo(self):
+        super().undo()
+        if self.owner is not None:
+            self.owner.forget(self.card)
+
+
+class StatsStep:
+    """A grade counted in the statistics of a deck"""
+
+    def __init__(self, stats, grade, old_easiness, new_easiness):
+        self.stats = stats
+        self.grade = grade
+        self.old_easiness = old_easiness
+        self.new_easiness = new_easiness
+
+    def undo(self):
+        self.stats.graded(self.grade, self.old_easiness, self.new_easiness, -1)
+
+    def redo(self):
+        self.stats.graded(self.grade, self.old_easiness, self.new_easiness)
+
+
+class Command:
+    """One undoable user action, made of the steps it took"""
+
+    def __init__(self, steps, refresh=None):
+        self.steps = steps
+        self.refresh = refresh
+
+    def undo(self):
+        for step in reversed(self.steps):
+            step.undo()
+        if self.refresh is not None:
+            self.refresh()
+
+    def redo(self):
+        for step in self.steps:
+            step.redo()
+        if self.refresh is not None:
+            self.refresh()
+
+
+class CommandLog:
+    """Undo/redo history of the last 'size' commands"""
+
+    def __init__(self, size=100):
+        self.undo_stack = collections.deque(maxlen=size)
+        self.redo_stack = []
+
+    def record(self, command):
+        self.undo_stack.append(command)
+        self.redo_stack = []
+
+    def undo(self, event=None):
+        if self.undo_stack:
+            command = self.undo_stack.pop()
+            command.undo()
+            self.redo_stack.append(command)
+
+    def redo(self, event=None):
+        if self.redo_stack:
+            command = self.redo_stack.pop()
+            command.redo()
+            self.undo_stack.append(command)
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack = []
+
+
 class MainWindow:
 
+    first_paint_target = 0.3  # Seconds from start until the window is shown
+
     def __init__(self):
+        self.started = time.perf_counter()
+        self.first_paint = None
         self.app = tkinter.Tk()
         self.tab_control = ttk.Notebook(self.app)
         self.cards = CardsTab(self.tab_control)
         self.decks = DecksTab(self.tab_control)
+        self.stats = StatsTab(self.tab_control)
         self.declare_tabs()
         self.app.title("The Flash")
         self.app.protocol("WM_DELETE_WINDOW", self.on_closing)
-
+        self.app.bind("<Map>", self.on_map)
+        self.app.bind("<Control-z>", self.cards.history.undo)
+        self.app.bind("<Control-y>", self.cards.history.redo)
+
+    def on_map(self, event):
+        """Decks are only read once the window is on screen, so startup doesn't wait for storage"""
+        if self.first_paint is not None or event.widget is not self.app:
+            return
+        self.first_paint = time.perf_counter() - self.started
+        if self.first_paint > self.first_paint_target:
+            print(f"Slow startup: window shown after {self.first_paint:.3f}s")
+        self.app.after(1, self.decks.startup_refresh)
 
     def declare_tabs(self):
         self.tab_control.add(self.decks.frame, text='Decks')
         self.tab_control.add(self.cards.frame, text='Cards')
+        self.tab_control.add(self.stats.frame, text='Stats')
         self.tab_control.grid(row=0, column=0)
+        self.tab_control.bind("<<NotebookTabChanged>>", self.tab_changed)
+
+    def tab_changed(self, event):
+        if self.tab_control.select() == str(self.stats.frame):
+            self.stats.refresh()
 
     def on_closing(self):
+        self.cards.finish()
         self.app.destroy()
 
+class StatsTab:
+    """Retention, easiness and upcoming workload per deck, read from the stored deck summaries"""
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.frame = tkinter.Frame(self.parent)
+        self.summaries = {}
+        self.name_label = tkinter.Label(self.frame, text="Name")
+        self.retention_label = tkinter.Label(self.frame, text="Retention")
+        self.easiness_label = tkinter.Label(self.frame, text="Avg Easiness")
+        self.week_label = tkinter.Label(self.frame, text="Due in 7 days")
+        self.name_list = tkinter.Listbox(self.frame, exportselection=False)
+        self.retention_list = tkinter.Listbox(self.frame)
+        self.easiness_list = tkinter.Listbox(self.frame)
+        self.week_list = tkinter.Listbox(self.frame)
+        self.details = tkinter.Label(self.frame, text="", justify="left", wraplength=500)
+        self.name_list.bind("<<ListboxSelect>>", self.show_details)
+        self._position()
+
+    def _position(self):
+        self.name_label.grid(row=0, column=0)
+        self.retention_label.grid(row=0, column=1)
+        self.easiness_label.grid(row=0, column=2)
+        self.week_label.grid(row=0, column=3)
+        self.name_list.grid(row=1, column=0)
+        self.retention_list.grid(row=1, column=1)
+        self.easiness_list.grid(row=1, column=2)
+        self.week_list.grid(row=1, column=3)
+        self.details.grid(row=2, column=0, columnspan=4, sticky="w")
+
+    def refresh(self):
+        self.summaries = storage.summaries()
+        for lst in (self.name_list, self.retention_list, self.easiness_list, self.week_list):
+            lst.delete(0, 'end')
+        for name, summary in sorted(self.summaries.items()):
+            stats = summary.get("stats")  # Missing until the deck is summarized again
+            retention = stats.retention() if stats is not None else None
+            easiness = stats.average_easiness() if stats is not None else None
+            self.name_list.insert('end', name)
+            self.retention_list.insert('end', "-" if retention is None else f"{retention:.0%}")
+            self.easiness_list.insert('end', "-" if easiness is None else f"{easiness:.2f}")
+            self.week_list.insert('end', count_due(summary["due"], summary["due_days"], 6))
+        self.details['text'] = ""
+
+    def show_details(self, event):
+        if not self.name_list.curselection():
+            return
+        name = self.name_list.get(self.name_list.curselection())
+        summary = self.summaries[name]
+        stats = summary.get("stats")
+        forecast = forecast_days(summary["due_days"])
+        forecast[0] += summary["due"]
+        text = "Due per day, from today: " + ", ".join(str(n) for n in forecast)
+        if stats is not None:
+            text += "\nGrades bad/medium/good: " + "/".join(str(n) for n in stats.grades)
+            text += "\nEasiness: " + ", ".join(f"{e}: {n}" for e, n in sorted(stats.easiness.items()))
+        self.details['text'] = text
+
+
 class CardsTab:
 
+    batch_size = 50  # Unsaved grades after which the next short pause already saves
+    save_delay = 2000  # Ms without a grade after which the loaded deck is saved
+    short_delay = 250
+
     def __init__(self, parent):
         self.parent = parent
         self.frame = tkinter.Frame(self.parent)
@@ -282,6 +874,13 @@ class CardsTab:
         self.repetitions = Repetitions(self.tab_control)
         self.new = New(self.tab_control)
         self.fails = Fails(self.tab_control)
+        self.history = CommandLog()  # Grades given in the loaded deck
+        self.unsaved = 0  # Grades given since the loaded deck was last saved
+        self.texts_changed = False  # EditDeck changed cards since then, so the index is out of date
+        self.save_job = None
+        self.rapid = tkinter.IntVar(self.frame, 0)
+        self.rapid_button = tkinter.Checkbutton(self.frame, text="Rapid review (space, 1/2/3)",
+                                                variable=self.rapid, command=self.toggle_rapid)
         self.declare_tabs()
         self.position()
 
@@ -292,6 +891,63 @@ class CardsTab:
 
     def position(self):
         self.tab_control.grid(row=0, column=0)
+        self.rapid_button.grid(row=1, column=0)
+
+    def toggle_rapid(self):
+        """Rapid review: space shows the answer, 1/2/3 grade bad/medium/good"""
+        root = self.frame.winfo_toplevel()
+        keys = {"<space>": self.key_check, "<Key-1>": self.key_grade, "<Key-2>": self.key_grade,
+                "<Key-3>": self.key_grade}
+        for key, handler in keys.items():
+            if self.rapid.get():
+                root.bind(key, handler)
+            else:
+                root.unbind(key)
+
+    def current_tab(self):
+        tabs = {str(t.frame): t for t in (self.repetitions, self.new, self.fails)}
+        return tabs[self.tab_control.select()]
+
+    def show_all(self):
+        for tab in (self.repetitions, self.new, self.fails):
+            tab.show()
+
+    def reviewing(self, event):
+        """Keys only review while the Cards tab is shown and no text field has the focus"""
+        return (application.tab_control.select() == str(self.frame)
+                and not isinstance(event.widget, tkinter.Entry))
+
+    def key_check(self, event):
+        if self.reviewing(event):
+            self.current_tab().check()
+
+    def key_grade(self, event):
+        if self.reviewing(event):
+            self.current_tab().grade(int(event.char) - 1)
+
+    def record(self):
+        """Count a grade. The deck is saved once grading pauses, never while handling a grade"""
+        self.unsaved += 1
+        if self.save_job is not None:
+            self.frame.after_cancel(self.save_job)
+        delay = self.short_delay if self.unsaved >= self.batch_size else self.save_delay
+        self.save_job = self.frame.after(delay, self.flush)
+
+    def flush(self, force=False):
+        if self.save_job is not None:
+            self.frame.after_cancel(self.save_job)
+            self.save_job = None
+        deck = application.decks.loaded_deck
+        if deck is not None and (self.unsaved or force):
+            # Grading doesn't change card text, so the index only needs updating after EditDeck
+            storage.save_deck(deck.name, deck, reindex=self.texts_changed)
+            self.unsaved = 0
+            self.texts_changed = False
+            application.decks.soft_refresh()
+
+    def finish(self):
+        """Save the loaded deck before it is closed, including grades undone since the last save"""
+        self.flush(force=bool(self.history.undo_stack or self.history.redo_stack))
 
 class GeneralCardTab:
 
@@ -302,23 +958,28 @@ class GeneralCardTab:
         self.current_card_index = 0
         self.card_list = []
         self.cards_left = 0
+        self.revealed = False
+        self.redraw_pending = False
         self.cards_left_label = tkinter.Label(self.frame, text="0")
         self.label1 = tkinter.Label(self.frame, text="Label1")
         self.label2 = tkinter.Label(self.frame, text="Label2")
         self.check_button = tkinter.Button(self.frame, text="Check", command=self.check)
-        self.good = tkinter.Button(self.frame, text="Good", command=self.good)
-        self.medium = tkinter.Button(self.frame, text="Medium", command=self.medium)
-        self.bad = tkinter.Button(self.frame, text="Bad", command=self.bad)
+        self.good_button = tkinter.Button(self.frame, text="Good", command=self.good)
+        self.medium_button = tkinter.Button(self.frame, text="Medium", command=self.medium)
+        self.bad_button = tkinter.Button(self.frame, text="Bad", command=self.bad)
         self.m = tkinter.Menu(self.frame, tearoff=0)
         self.m.add_command(label="Edit Card", command=self.edit)
         self.m.add_command(label="Delete Card", command=self.delete)
+        self.m.add_command(label="Undo", command=lambda: application.cards.history.undo())
+        self.m.add_command(label="Redo", command=lambda: application.cards.history.redo())
         self.frame.bind("<Button-3>", self.do_popup)
+        self.moves = []  # Container changes made by next_card, for undo
         self._position()
 
     def new_load(self):
-        self.current_card_index = len(self.card_list) + 1
-        self.label1['text'] = self.card_list[0].l1
-        self.label2['text'] = " "
+        self.current_card_index = 0
+        self.revealed = False
+        self.request_redraw()
 
     def do_popup(self, event):
         try:
@@ -326,8 +987,13 @@ class GeneralCardTab:
         finally:
             self.m.grab_release()
 
+    def has_card(self):
+        return 0 <= self.current_card_index < len(self.card_list)
+
     def check(self):
-        self.label2['text'] = self.card_list[self.current_card_index].l2
+        if self.has_card():
+            self.revealed = True
+            self.request_redraw()
 
 
     def _position(self):
@@ -335,42 +1001,77 @@ class GeneralCardTab:
         self.label1.grid(row=1, column=1)
         self.label2.grid(row=2, column=1)
         self.check_button.grid(row=3, column=1)
-        self.good.grid(row=4, column=0)
-        self.medium.grid(row=4, column=1)
-        self.bad.grid(row=4, column=2)
+        self.good_button.grid(row=4, column=0)
+        self.medium_button.grid(row=4, column=1)
+        self.bad_button.grid(row=4, column=2)
 
     def good(self):
-        self.card_list[self.current_card_index].last_grade = 2
-        self.next_card()
+        self.grade(2)
 
     def medium(self):
-        self.card_list[self.current_card_index].last_grade = 1
-        self.next_card()
+        self.grade(1)
 
     def bad(self):
-        self.card_list[self.current_card_index].last_grade = 0
+        self.grade(0)
+
+    def grade(self, value):
+        """Grade the current card and move on, recording what changed so it can be undone"""
+        if not self.has_card():
+            return
+        card = self.card_list[self.current_card_index]
+        stats = application.decks.loaded_deck.statistics()
+        before = card_fields(card)
+        old_easiness = card.easiness
+        index = self.current_card_index
+        self.moves = []
+        card.last_grade = value
         self.next_card()
+        counted = StatsStep(stats, value, old_easiness, card.easiness)
+        counted.redo()
+        steps = [FieldsStep(card, before), counted] + self.moves + [IndexStep(self, index, self.current_card_index)]
+        application.cards.history.record(Command(steps, application.cards.show_all))
+        application.cards.record()
+
+    def show(self):
+        """Show the current card with its answer hidden"""
+        self.revealed = False
+        self.request_redraw()
+
+    def request_redraw(self):
+        """Labels are written once per idle turn, however many changes asked for it"""
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.frame.after_idle(self.redraw)
+
+    def redraw(self):
+        self.redraw_pending = False
+        if self.has_card():
+            card = self.card_list[self.current_card_index]
+            self.label1['text'] = card.l1
+            self.label2['text'] = card.l2 if self.revealed else " "
+        else:
+            self.label1['text'] = " "
+            self.label2['text'] = " "
+        self.cards_left = max(len(self.card_list) - self.current_card_index, 0)
+        self.cards_left_label['text'] = str(self.cards_left)
 
     def next_card(self):
-        # To be overridden by each function anyway
+        """Reschedule the graded card and take it out of this tab: failed cards go to the Fails
+        tab, the others into all_repetitions until they are due again"""
         sm = IntervalAlgorithm()
         sm.algo(self.card_list[self.current_card_index])
-        c = self.card_list.pop()
+        c = self.card_list.pop(self.current_card_index)
+        self.moves.append(ListRemoveStep(self.card_list, self.current_card_index, c))
         if c.last_grade < 2:
             application.cards.fails.card_list.append(c)
+            self.moves.append(ListAppendStep(application.cards.fails.card_list, c))
+            application.cards.fails.request_redraw()
         else:
-            application.decks.loaded_deck.all_repetitions.append(c)
-        if self.current_card_index > 0:
-            self.current_card_index -= 1
-        else:
-            if len(self.card_list) > 0:
-                self.current_card_index = len(self.card_list) + 1
-            else:
-                self.label1['text'] = " "
-                self.label2['text'] = " "
-
-        self.label1['text'] = self.card_list[self.current_card_index].l1
-        self.label2['text'] = self.card_list[self.current_card_index].l2
+            e = application.decks.loaded_deck.schedule(c)
+            self.moves.append(ScheduleStep(application.decks.loaded_deck, e))
+        if self.current_card_index >= len(self.card_list):
+            self.current_card_index = 0  # Start again from the first card still left
+        self.show()
 
 
     def edit(self):
@@ -387,15 +1088,6 @@ class Repetitions(GeneralCardTab):
     def __init__(self, parent):
         super().__init__(parent)
 
-    def next_card(self):
-        # To be overridden by each function anyway
-        sm = IntervalAlgorithm()
-        sm.algo(self.card_list[self.current_card_index])
-
-        self.current_card_index += 1
-        self.label1['text'] = self.card_list[self.current_card_index].l1
-        self.label2['text'] = self.card_list[self.current_card_index].l2
-
 
 
 
@@ -404,15 +1096,6 @@ class New(GeneralCardTab):
     def __init__(self, parent):
         super().__init__(parent)
 
-    def next_card(self):
-        # To be overridden by each function anyway
-        sm = IntervalAlgorithm()
-        sm.algo(self.card_list[self.current_card_index])
-
-        self.current_card_index += 1
-        self.label1['text'] = self.card_list[self.current_card_index].l1
-        self.label2['text'] = self.card_list[self.current_card_index].l2
-
 class Fails(GeneralCardTab):
 
     def __init__(self, parent):
@@ -428,6 +1111,7 @@ class DecksTab:
         self.parent = parent
         self.frame = tkinter.Frame(self.parent)
         self.loaded_deck = None
+        self.refreshed = False
         self.loaded_deck_label = tkinter.Label(self.frame, text="Currently Loaded Deck: None", wraplength=140)
         self.new_button = tkinter.Button(self.frame, text="New+", command=self.new)
         self.new_name_entry = tkinter.Entry(self.frame, text="New Deck")
@@ -445,9 +1129,10 @@ class DecksTab:
         self.m.add_command(label="Edit Deck", command=self.edit)
         self.m.add_command(label="Delete Deck", command=self.confirm)
         self.m.add_command(label="Load Deck", command=self.load)
+        self.m.add_command(label="Compact Storage", command=self.compact)
         self.name_list.bind("<Button-3>", self.do_popup)
-        # self.hard_refresh()
-        self.soft_refresh()
+        self.rows = []  # Deck name shown in each row of the lists
+        # Lists are filled by startup_refresh once the main window is shown
 
     def confirm(self):
         answer = tkinter.messagebox.askokcancel(title='Confirmation',
@@ -457,14 +1142,34 @@ class DecksTab:
 
     def edit(self):
         name = self.name_list.get(self.name_list.curselection())
-        d = storage.access_deck(name)
+        if self.loaded_deck is not None and name == self.loaded_deck.name:
+            d = self.loaded_deck  # Edit the reviewed copy, or the next save of it would undo the edits
+        else:
+            d = storage.access_deck(name)
         wind = EditDeck(d)
 
     def delete(self):
         name = self.name_list.get(self.name_list.curselection())
+        if self.loaded_deck is not None and name == self.loaded_deck.name:
+            self.unload()
         storage.remove_deck(name)
         self.soft_refresh()
 
+    def unload(self):
+        """Stop reviewing the loaded deck without saving it, e.g. because it was deleted"""
+        self.loaded_deck = None
+        application.cards.unsaved = 0
+        application.cards.texts_changed = False
+        application.cards.history.clear()
+        for tab in (application.cards.new, application.cards.repetitions, application.cards.fails):
+            tab.card_list = []
+            tab.new_load()
+        self.loaded_deck_label['text'] = "Currently Loaded Deck: None"
+
+    def compact(self):
+        storage.compact()
+        self.soft_refresh()
+
 
     def do_popup(self, event):
         try:
@@ -474,7 +1179,9 @@ class DecksTab:
 
     def load(self):
         name = self.name_list.get(self.name_list.curselection())
+        application.cards.finish()  # Save grades given in the previously loaded deck
         deck = storage.access_deck(name)
+        deck.check_repetitions()
         print(deck.name)
         application.cards.new.card_list = deck.new
         application.cards.new.new_load()
@@ -483,8 +1190,19 @@ class DecksTab:
         application.cards.fails.card_list = deck.fails.queue
         application.cards.fails.new_load()
         self.loaded_deck = deck
+        application.cards.history.clear()
         self.loaded_deck_label['text'] = "Currently loaded deck: " + deck.name
 
+    def edited(self):
+        """The loaded deck was edited and saved by EditDeck. Grades are saved with it, and their
+        undo history no longer matches the card lists"""
+        application.cards.unsaved = 0
+        application.cards.texts_changed = False
+        application.cards.history.clear()
+        for tab in (application.cards.new, application.cards.repetitions, application.cards.fails):
+            tab.new_load()  # Cards may have been deleted, start again from the first one
+        self.loaded_deck_label['text'] = "Currently loaded deck: " + self.loaded_deck.name
+
     def _position(self):
         self.loaded_deck_label.grid(row=0, column=1)
         self.new_button.grid(row=1, column=0, sticky="e")
@@ -504,32 +1222,79 @@ class DecksTab:
             wind = EditDeck(d)
 
     def soft_refresh(self):
-        the_list = storage.all_decks()
+        """Fill the lists from the stored deck summaries, without unpickling any deck"""
         self.name_list.delete(0, 'end')
         self.total_list.delete(0, 'end')
         self.repetitions_list.delete(0, 'end')
-        j = 0
-        for i in the_list:
-            temp = storage.access_deck(i)
-            self.name_list.insert(j, temp.name)
-            self.total_list.insert(j, temp.check_total_size())
-            self.repetitions_list.insert(j, len(temp.due_repetitions))
-            j += 1
+        self.rows = []
+        for name, summary in sorted(storage.summaries().items()):
+            self.show_summary(name, summary)
         self.colour_coordinate()
 
+    def show_summary(self, name, summary):
+        """Write a deck's summary into its row, adding the row if the deck isn't listed yet"""
+        due = count_due(summary["due"], summary["due_days"])
+        if name in self.rows:
+            j = self.rows.index(name)
+            self.total_list.delete(j)
+            self.total_list.insert(j, summary["total"])
+            self.repetitions_list.delete(j)
+            self.repetitions_list.insert(j, due)
+        else:
+            j = len(self.rows)
+            self.rows.append(name)
+            self.name_list.insert('end', name)
+            self.total_list.insert('end', summary["total"])
+            self.repetitions_list.insert('end', due)
+        return j
+
+    def startup_refresh(self):
+        """Show the cached summaries straight away. Every save keeps them current, so only decks
+        without an up to date summary, e.g. ones stored by an older version, are read, one per
+        event loop turn"""
+        self.refreshed = False
+        names = storage.all_decks()
+        summaries = storage.summaries()
+        for name in summaries.keys() - set(names):  # Summaries of vanished decks
+            storage.forget_summary(name)
+        self.soft_refresh()
+        missing = [name for name in names if not storage.summary_current(summaries.get(name))]
+        self.later(self.refresh_step, missing, 0)
+
+    def refresh_step(self, names, i):
+        """Summarize one deck per event loop turn so the window stays responsive"""
+        if i < len(names):
+            try:
+                summary = storage.summarize(names[i])
+            except KeyError:  # Removed by another process since the names were read
+                summary = None
+            if summary is not None:
+                self.colour_row(self.show_summary(names[i], summary))
+            self.later(self.refresh_step, names, i + 1)
+        else:
+            if names:
+                self.soft_refresh()  # Rows added above are at the end rather than sorted
+            self.refreshed = True
+
+    def later(self, func, *args):
+        self.frame.after(1, func, *args)
+
     def colour_coordinate(self):
         i = 0
         while i < self.name_list.size():
-            if i % 2 == 0:
-                self.name_list.itemconfig(i, bg="ivory")
-                self.total_list.itemconfig(i, bg="ivory")
-                self.repetitions_list.itemconfig(i, bg="ivory")
-            else:
-                self.name_list.itemconfig(i, bg="light blue")
-                self.total_list.itemconfig(i, bg="light blue")
-                self.repetitions_list.itemconfig(i, bg="light blue")
+            self.colour_row(i)
             i += 1
 
+    def colour_row(self, i):
+        if i % 2 == 0:
+            self.name_list.itemconfig(i, bg="ivory")
+            self.total_list.itemconfig(i, bg="ivory")
+            self.repetitions_list.itemconfig(i, bg="ivory")
+        else:
+            self.name_list.itemconfig(i, bg="light blue")
+            self.total_list.itemconfig(i, bg="light blue")
+            self.repetitions_list.itemconfig(i, bg="light blue")
+
 
     ''' Need method for commiting progress to save file upon exiting. Save after each repetition/newcard etc???? Might
     have a counter to save after x cards, otherwise might take too long to constantly access hard drive. Need to start
@@ -546,7 +1311,7 @@ class DecksTab:
             temp.check_repetitions()
             self.name_list.insert(j, temp.name)
             self.total_list.insert(j, temp.check_total_size())
-            self.repetitions_list.insert(j, len(temp.due_repetitions))
+            self.repetitions_list.insert(j, temp.due_count())
             j += 1
 
         self.colour_coordinate()
@@ -595,6 +1360,8 @@ class EditDeck:
         self.add_button = tkinter.Button(self.window, text="Add", command=self.add_card)
         self.save_button = tkinter.Button(self.window, text="Save", command=self.save)
         self.total_cards_label = tkinter.Label(self.window, text="Total cards: 0")
+        self.search_entry = tkinter.Entry(self.window)
+        self.search_button = tkinter.Button(self.window, text="Search", command=self.search)
         self.list1 = tkinter.Listbox(self.window)
         self.list2 = tkinter.Listbox(self.window)
         self._position()
@@ -604,11 +1371,21 @@ class EditDeck:
         self.m2.add_command(label="Delete Card", command=self.delete)
         self.m.add_command(label="Edit Card", command=self.edit)
         self.m2.add_command(label="Edit Card", command=self.edit)
+        self.history = CommandLog()
+        for menu in (self.m, self.m2):
+            menu.add_command(label="Undo", command=self.history.undo)
+            menu.add_command(label="Redo", command=self.history.redo)
+        self.window.bind("<Control-z>", self.history.undo)
+        self.window.bind("<Control-y>", self.history.redo)
         self.list1.bind("<Button-3>", self.do_popup)
         self.list2.bind("<Button-3>", self.do_popup)
         self.list1.bind("<MouseWheel>", self.mousewheel1)
         self.list2.bind("<MouseWheel>", self.mousewheel2)
         self.deck_name_entry.bind("<Button-1>", self.change_state)
+        self.search_entry.bind("<Return>", self.search)
+        self.card_ids = {card_id(c.l1, c.l2) for c in self.current_deck.all_cards()}
+        self.search_index = SearchIndex(self.current_deck.all_cards)
+        self.current_deck.statistics()  # Built before any card is added or removed
         self.fill_tables()
         self.total_cards = self.list1.size()
         self.total_cards_label['text'] = "Total cards: " + str(self.total_cards)
@@ -645,22 +1422,22 @@ class EditDeck:
         for i in self.current_deck.new:
             if i.l1 == name1 or i.l1 == name2:
                 if i.l2 == name1 or i.l2 == name2:
-                    s = EditCard(i)
+                    s = EditCard(i, self.card_changed)
                     return
         for i in self.current_deck.due_repetitions:
             if i.l1 == name1 or i.l1 == name2:
                 if i.l2 == name1 or i.l2 == name2:
-                    s = EditCard(i)
+                    s = EditCard(i, self.card_changed)
                     return
         for i in self.current_deck.fails.queue:
             if i.l1 == name1 or i.l1 == name2:
                 if i.l2 == name1 or i.l2 == name2:
-                    s = EditCard(i)
+                    s = EditCard(i, self.card_changed)
                     return
         for i in self.current_deck.all_repetitions.queue:
             if i._value.l1 == name1 or i._value.l1 == name2:
                 if i._value.l2 == name1 or i._value.l2 == name2:
-                    s = EditCard(i._value)
+                    s = EditCard(i._value, self.card_changed)
                     return
 
 
@@ -678,20 +1455,25 @@ class EditDeck:
         self.add_button.grid(row=3, column=0)
         self.save_button.grid(row=3, column=1)
         self.total_cards_label.grid(row=4, column=0)
+        self.search_entry.grid(row=4, column=1)
+        self.search_button.grid(row=4, column=2)
         self.list1.grid(row=5, column=0)
         self.list2.grid(row=5, column=1)
 
     def add_card(self):
         e1 = self.e1.get()
         e2 = self.e2.get()
-        if not (e1 == "" or e2 == ""):
-            c = Card(e1, e2)
-            self.current_deck.new.append(c)
+        if not (e1 == "" or e2 == "") and self.check_duplicate(e1, e2):
+            c = self.current_deck.new_card(e1, e2)
+            steps = [ListAppendStep(self.current_deck.new, c, self)]
             print(self.var)
-            if self.var == 1:
+            if self.var == 1 and card_id(e2, e1) != card_id(e1, e2) and card_id(e2, e1) not in self.card_ids:
                 print("hi")
-                c1 = Card(e2, e1)
-                self.current_deck.new.append(c1)
+                c1 = self.current_deck.new_card(e2, e1)
+                steps.append(ListAppendStep(self.current_deck.new, c1, self))
+            for step in steps:
+                step.redo()
+            self.history.record(Command(steps, self.refresh))
         self.e1.delete(0, 'end')
         self.e2.delete(0, 'end')
         self.fill_tables()
@@ -700,26 +1482,55 @@ class EditDeck:
         self.list1.yview(tkinter.END)
         self.list2.yview(tkinter.END)
 
-    def fill_tables(self):
+    def check_duplicate(self, e1, e2):
+        """Return True if the card should be added. Duplicates within this deck are refused,
+        duplicates in other decks are added only if the user confirms"""
+        if card_id(e1, e2) in self.card_ids:
+            tkinter.messagebox.showinfo(title='Duplicate', message='This card is already in the deck.')
+            return False
+        others = [d for d in storage.find_card(e1, e2) if d != self.old_name]
+        if others:
+            return tkinter.messagebox.askokcancel(title='Duplicate',
+                          message='This card is already in: ' + ", ".join(others) + '. Add anyway?')
+        return True
+
+    def card_changed(self, card, old_l1, old_l2):
+        """Called by EditCard after it changes the text of one of this deck's cards"""
+        self.history.record(Command([TextStep(card, old_l1, old_l2, self)]))
+        self.retext(card, old_l1, old_l2)
+
+    def retext(self, card, old_l1, old_l2):
+        self.card_ids.discard(card_id(old_l1, old_l2))
+        self.card_ids.add(card_id(card.l1, card.l2))
+        self.search_index.update(card)
+        self.fill_tables()
+        self.changed()
+
+    def forget(self, card):
+        """Drop a deleted card from the duplicate set, the search index and the statistics"""
+        self.card_ids.discard(card_id(card.l1, card.l2))
+        self.search_index.remove(card)
+        self.current_deck.statistics().remove_card(card)
+        self.changed()
+
+    def search(self, event=None):
+        query = self.search_entry.get()
+        if query.strip() == "":
+            self.fill_tables()
+        else:
+            self.fill_tables(self.search_index.search(query))
+
+    def fill_tables(self, cards=None):
+        """Fill the lists with the given cards, or with the whole deck"""
+        if cards is None:
+            cards = self.current_deck.all_cards()
         self.list1.delete(0, 'end')
         self.list2.delete(0, 'end')
         j = 0
-        for i in self.current_deck.new:
-            self.list1.insert(j, i.l1)
-            self.list2.insert(j, i.l2)
-            j += 1
-        for i in self.current_deck.fails.queue:
+        for i in cards:
             self.list1.insert(j, i.l1)
             self.list2.insert(j, i.l2)
             j += 1
-        for i in self.current_deck.due_repetitions:
-            self.list1.insert(j, i.l1)
-            self.list2.insert(j, i.l2)
-            j += 1
-        for i in self.current_deck.all_repetitions.queue:
-            self.list1.insert(j, i._value.l1)
-            self.list2.insert(j, i._value.l2)
-            j += 1
         self.colour_coordinate()
 
 
@@ -733,82 +1544,50 @@ class EditDeck:
             number = self.list2.index(tkinter.ACTIVE)
             name1 = self.list2.get(tkinter.ACTIVE)
             name2 = self.list1.get(number)
-        card_counter = 0
-        list_index = 0
-        for card in self.current_deck.new:
-            if card.l1 == name1:
-                if card.l2 == name2:
-                    card_counter += 1
-                    del self.current_deck.new[list_index]
-            if self.var == 1:
-                if card.l1 == name2:
-                    if card.l2 == name1:
-                        card_counter += 1
-                        del self.current_deck.new[list_index]
-            if self.var == 1:
-                if card_counter == 2:
-                    return
-            else:
-                if card_counter == 1:
-                    return
-            list_index += 1
-        list_index = 0
-        for card in self.current_deck.fails.queue:
-            if card.l1 == name1:
-                if card.l2 == name2:
-                    card_counter += 1
-                    del self.current_deck.fails.queue[list_index]
-            if self.var == 1:
-                if card.l1 == name2:
-                    if card.l2 == name1:
-                        card_counter += 1
-                        del self.current_deck.fails.queue[list_index]
-            if self.var == 1:
-                if card_counter == 2:
-                    return
-            else:
-                if card_counter == 1:
-                    return
-            list_index += 1
-        list_index = 0
-        for card in self.current_deck.due_repetitions:
-            if card.l1 == name1:
-                if card.l2 == name2:
-                    card_counter += 1
-                    del self.current_deck.due_repetitions[list_index]
-            if self.var == 1:
-                if card.l1 == name2:
-                    if card.l2 == name1:
-                        card_counter += 1
-                        del self.current_deck.due_repetitions[list_index]
-            if self.var == 1:
-                if card_counter == 2:
-                    return
-            else:
-                if card_counter == 1:
-                    return
-            list_index += 1
-        list_index = 0
-        for card in self.current_deck.all_repetitions.queue:
-            if card._value.l1 == name1:
-                if card._value.l2 == name2:
-                    card_counter += 1
-                    del self.current_deck.all_repetitions.queue[list_index]
-            if self.var == 1:
-                if card.l1 == name2:
-                    if card._value.l2 == name1:
-                        card_counter += 1
-                        del self.current_deck.all_repetitions.queue[list_index]
-            if self.var == 1:
-                if card_counter == 2:
-                    return
-            else:
-                if card_counter == 1:
-                    return
-            list_index += 1
+        targets = [(name1, name2)]
+        if self.var == 1:
+            targets.append((name2, name1))
+        steps = []
+        for l1, l2 in targets:
+            step = self.find_removal(l1, l2)
+            if step is not None:
+                step.redo()
+                steps.append(step)
+        if steps:
+            self.history.record(Command(steps, self.refresh))
+        self.refresh()
+
+    def find_removal(self, l1, l2):
+        """Return the step that removes card l1/l2 from wherever it is in the deck"""
+        for lst in (self.current_deck.new, self.current_deck.fails.queue, self.current_deck.due_repetitions):
+            for list_index, card in enumerate(lst):
+                if card.l1 == l1 and card.l2 == l2:
+                    return ListRemoveStep(lst, list_index, card, self)
+        for e in self.current_deck.all_repetitions.queue:
+            if e._value.l1 == l1 and e._value.l2 == l2:
+                return UnscheduleStep(self.current_deck, e, self)
+        return None
+
+    def remember(self, card):
+        """Put a new card, or one brought back by undo, into the duplicate set, the search index
+        and the statistics"""
+        self.card_ids.add(card_id(card.l1, card.l2))
+        self.search_index.add(card)
+        self.current_deck.statistics().add_card(card)
+        self.changed()
+
+    def changed(self):
+        """A card of the deck was added, removed or retexted. If it is the loaded deck, the
+        Cards tab's undo history may bring back a card deleted here, so it is dropped"""
+        if self.current_deck is application.decks.loaded_deck:
+            application.cards.history.clear()
+            application.cards.texts_changed = True
+            application.cards.show_all()
+
+    def refresh(self):
         self.fill_tables()
         self.total_cards = self.list1.size()
-        self.total_cards_label['text'] = "total cards:", self.total_cards
+        self.total_cards_label['text'] = "Total cards: " + str(self.total_cards)
 
     def colour_coordinate(self):
         i = 0
@@ -825,11 +1604,13 @@ class EditDeck:
 
     def save(self):
         if self.deck_name_entry.get() != self.old_name:
-            storage.remove_deck(self.old_name)
             self.current_deck.name = self.deck_name_entry.get()
         name = self.deck_name_entry.get()
         cd = self.current_deck
-        storage.save_deck(name, cd)
+        cd.tidy_store()
+        storage.save_deck(name, cd, self.old_name)
+        if cd is application.decks.loaded_deck:
+            application.decks.edited()
         time.sleep(0.25)
         application.decks.soft_refresh()
         self.window.destroy()
@@ -838,54 +1619,581 @@ class EditDeck:
 
 class EditCard:
 
-    def __init__(self, card):
+    def __init__(self, card, on_change=None):
         self.window = tkinter.Tk()
         self.e1 = tkinter.Entry(self.window)
         self.e2 = tkinter.Entry(self.window)
         self.card = card
+        self.on_change = on_change
         self.e1.insert(0, self.card.l1)
         self.e2.insert(0, self.card.l2)
         self.save = tkinter.Button(self.window, text="Save", command=self.save)
+        self._position()
+
+    def _position(self):
+        self.e1.grid(row=0, column=0)
+        self.e2.grid(row=0, column=1)
+        self.save.grid(row=1, column=0)
 
     def save(self):
+        old_l1, old_l2 = self.card.l1, self.card.l2
         self.card.l1 = self.e1.get()
         self.card.l2 = self.e2.get()
+        if self.on_change is not None:
+            self.on_change(self.card, old_l1, old_l2)
         self.window.destroy()
 
     '''Need to handle database somewhere or handle the list where card is stored.'''
 
+def normalize_text(text):
+    """Normalize card text for comparisons: collapse whitespace and ignore case"""
+    return " ".join(text.split()).casefold()
+
+
+def read_shelf(name):
+    """Open a shelve read-only, so readers holding a shared lock don't need write access,
+    which dbm.gnu only grants to one process at a time. A shelve not created yet reads as empty"""
+    try:
+        return shelve.open(name, "r")
+    except dbm.error:
+        return shelve.Shelf({})
+
+
+def card_id(l1, l2):
+    """Identify a card by its normalized text, so duplicates share an id"""
+    return normalize_text(l1), normalize_text(l2)
+
+
+class CardIndex:
+    """Persistent inverted index of card text. Maps each normalized text to the decks it
+    appears in and the ids of the cards there, so lookups don't need to unpickle any deck.
+    It is kept in SQLite rather than a shelve: dbm.dumb reads its whole directory on every
+    open, which made each lookup take as long as loading the index"""
+
+    def __init__(self, name="Index"):
+        self.name = name
+        self.path = name + ".sqlite"
+        self.db = None
+
+    def _connect(self, create=True):
+        """Open the index once and keep it open. Returns None if it doesn't exist yet and
+        'create' is False, so reads don't create it"""
+        if self.db is None:
+            if not create and not os.path.exists(self.path):
+                return None
+            self.db = sqlite3.connect(self.path, timeout=60)
+            with self.db:
+                self.db.execute("CREATE TABLE IF NOT EXISTS entries "
+                                "(text TEXT, deck TEXT, ids BLOB, PRIMARY KEY (text, deck)) WITHOUT ROWID")
+                self.db.execute("CREATE INDEX IF NOT EXISTS entries_deck ON entries (deck)")
+                self.db.execute("CREATE TABLE IF NOT EXISTS flags (name TEXT PRIMARY KEY)")
+        return self.db
+
+    def is_built(self):
+        db = self._connect(create=False)
+        return db is not None and db.execute("SELECT 1 FROM flags WHERE name = 'built'").fetchone() is not None
+
+    def terms(self, deck):
+        """Map each normalized text in 'deck' to the ids of the cards using it"""
+        terms = {}
+        for card in deck.all_cards():
+            cid = card_id(card.l1, card.l2)
+            for t in cid:
+                terms.setdefault(t, set()).add(cid)
+        return terms
+
+    def update_deck(self, name, terms):
+        """Make the entries of deck 'name' match 'terms' (see terms()). Only texts whose cards
+        changed are written, so re-saving an unchanged deck writes nothing"""
+        db = self._connect()
+        old = {t: pickle.loads(ids) for t, ids in db.execute("SELECT text, ids FROM entries WHERE deck = ?", (name,))}
+        with db:
+            db.executemany("DELETE FROM entries WHERE text = ? AND deck = ?",
+                           [(t, name) for t in old.keys() - terms.keys()])
+            db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                           [(t, name, pickle.dumps(ids)) for t, ids in terms.items() if old.get(t) != ids])
+
+    def remove_deck(self, name):
+        with self._connect() as db:
+            db.execute("DELETE FROM entries WHERE deck = ?", (name,))
+
+    def mark_built(self):
+        """Every stored deck is indexed"""
+        with self._connect() as db:
+            db.execute("INSERT OR IGNORE INTO flags VALUES ('built')")
+
+    def lookup(self, text):
+        """Return {deck name: set of card ids} for every card containing 'text' as a side"""
+        db = self._connect(create=False)
+        if db is None:
+            return {}
+        rows = db.execute("SELECT deck, ids FROM entries WHERE text = ?", (normalize_text(text),))
+        return {deck: pickle.loads(ids) for deck, ids in rows}
+
+    def compact(self):
+        self._connect().execute("VACUUM")
+
+
+class SearchIndex:
+    """In-memory search over the cards of a deck. A trigram index answers substring queries and
+    a sorted list of texts answers prefix queries; both are updated card by card. The index is
+    only built on the first search, so opening a big deck for editing stays cheap"""
+
+    def __init__(self, source):
+        self.source = source  # callable returning the cards to index
+        self.grams = {}  # trigram -> set of card ids
+        self.cards = None  # card id -> (card, normalized l1, normalized l2)
+        self.texts = []  # sorted (normalized text, card id) pairs
+
+    def _build(self):
+        self.cards = {}
+        for card in self.source():
+            self._index(card)
+        self.texts = sorted((t, i) for i, (c, t1, t2) in self.cards.items() for t in (t1, t2))
+
+    def _index(self, card):
+        t1, t2 = normalize_text(card.l1), normalize_text(card.l2)
+        self.cards[id(card)] = (card, t1, t2)
+        for g in self.trigrams(t1) | self.trigrams(t2):
+            self.grams.setdefault(g, set()).add(id(card))
+        return t1, t2
+
+    def trigrams(self, text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, card):
+        if self.cards is None:  # Not built yet, the card will be picked up by _build
+            return
+        for t in self._index(card):
+            bisect.insort(self.texts, (t, id(card)))
+
+    def remove(self, card):
+        if self.cards is None:
+            return
+        entry = self.cards.pop(id(card), None)
+        if entry is None:
+            return
+        c, t1, t2 = entry
+        for g in self.trigrams(t1) | self.trigrams(t2):
+            ids = self.grams[g]
+            ids.discard(id(card))
+            if not ids:
+                del self.grams[g]
+        for t in (t1, t2):
+            i = bisect.bisect_left(self.texts, (t, id(card)))
+            if i < len(self.texts) and self.texts[i] == (t, id(card)):
+                del self.texts[i]
+
+    def update(self, card):
+        """Re-index a card after its text changed. The index still holds the old text"""
+        self.remove(card)
+        self.add(card)
+
+    def search(self, query, limit=500):
+        """Return cards with a side starting with 'query', then cards containing it elsewhere.
+        Queries shorter than 3 characters only match prefixes"""
+        if self.cards is None:
+            self._build()
+        q = normalize_text(query)
+        found = {}
+        i = bisect.bisect_left(self.texts, (q,))
+        while i < len(self.texts) and self.texts[i][0].startswith(q) and len(found) < limit:
+            found[self.texts[i][1]] = True
+            i += 1
+        if len(q) >= 3:
+            candidates = None
+            for g in sorted(self.trigrams(q), key=lambda g: len(self.grams.get(g, ()))):
+                ids = self.grams.get(g, set())
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    break
+            for i in candidates:
+                if len(found) >= limit:
+                    break
+                c, t1, t2 = self.cards[i]
+                if q in t1 or q in t2:
+                    found[i] = True
+        return [self.cards[i][0] for i in found]
+
+
+class FileLock:
+    """Lock held on a file next to the store while it is used. Readers share the lock and a
+    writer holds it alone. Without fcntl (Windows) every lock is exclusive.
+    flock doesn't favour writers, so readers taking turns could keep one waiting forever. A
+    second lock file, the gate, is held by writers throughout and by readers only until they
+    have the main lock, so once a writer is at the gate no new reader gets in"""
+
+    def __init__(self, path, exclusive):
+        self.path = path
+        self.exclusive = exclusive
+        self.file = None
+        self.gate = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.gate = open(self.path + ".gate", "a+b")
+            fcntl.flock(self.gate.fileno(), fcntl.LOCK_EX)
+        self.file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+            if not self.exclusive:
+                self._open_gate()
+        else:
+            self.file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10 seconds, keep waiting
+                    pass
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+        if self.gate is not None:
+            self._open_gate()
+
+    def _open_gate(self):
+        fcntl.flock(self.gate.fileno(), fcntl.LOCK_UN)
+        self.gate.close()
+        self.gate = None
+
+
+def _zstd_compress(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# Compression name -> (tag stored in front of the data, compress(data, level), decompress(data))
+codecs = {
+    "none": (b"p", lambda data, level: data, lambda data: data),
+    "zlib": (b"z", zlib.compress, zlib.decompress),
+    "lzma": (b"x", lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+if zstandard is not None:
+    codecs["zstd"] = (b"s", _zstd_compress, _zstd_decompress)
+tags = {tag: decompress for tag, compress, decompress in codecs.values()}
+tag_names = {b"p": "none", b"z": "zlib", b"x": "lzma", b"s": "zstd"}  # Including codecs not installed
+
+
 class DeckFile:
+    """The Decks shelve plus its index and summaries. Every write is first appended to a
+    journal and fsynced, which is the commit point, then applied to the shelves. A journal
+    left behind by a crash is replayed before the store is next used.
+    Decks are stored as compressed pickles; 'level' is passed to the chosen codec as is"""
 
-    def __init__(self):
+    def __init__(self, compression="zlib", level=6):
         self.name = "Decks"
-
+        self.index = CardIndex()
+        self.summary_name = "Summary"
+        self.lock_name = self.name + ".lock"
+        self.journal_name = self.name + ".journal"
+        self.compact_marker = self.name + ".compacting"
+        self.compression = compression
+        self.level = level
+        self.index_checked = False
+        with self.locked(exclusive=True):
+            self._recover()
+
+    def locked(self, exclusive=False):
+        return FileLock(self.lock_name, exclusive)
+
+    def reading(self):
+        """Shared lock for reads. Recovers first if a writer died halfway through"""
+        if self._journal_pending() or os.path.exists(self.compact_marker):
+            with self.locked(exclusive=True):
+                self._recover()
+        return self.locked(exclusive=False)
 
     def access_deck(self, name):
-        st = shelve.open(self.name)
-        temp = st[name]
-        st.close()
-        return temp
+        with self.reading():
+            st = read_shelf(self.name)
+            temp = st[name]
+            st.close()
+        return self.decode(temp)
+
+    def encode(self, deck):
+        tag, compress, decompress = codecs[self.compression]
+        return tag + compress(pickle.dumps(deck), self.level)
+
+    def decode(self, value):
+        if not isinstance(value, bytes):  # Stored before compression was added
+            return value
+        if value[:1] not in tags:
+            codec = tag_names.get(value[:1], repr(value[:1]))
+            hint = " (pip install zstandard)" if codec == "zstd" else ""
+            raise ValueError(f"Deck is compressed with {codec}, which is not available{hint}")
+        return pickle.loads(tags[value[:1]](value[1:]))
 
     def all_decks(self):
-        st = shelve.open(self.name)
-        mylist = list(st.keys())
-        st.close()
+        with self.reading():
+            st = read_shelf(self.name)
+            mylist = list(st.keys())
+            st.close()
         return mylist
 
-    def save_deck(self, name, value):
-        st = shelve.open(self.name, writeback=True)
-        st[name] = value
-        st.close()
+    def save_deck(self, name, value, old_name=None, reindex=True):
+        """Save a deck. If it was renamed, the old entry goes in the same transaction. Pass
+        reindex=False if no card text changed since the deck was last saved"""
+        ops = [("save", name, value)]
+        if old_name is not None and old_name != name:
+            ops.insert(0, ("remove", old_name))
+        self._write(ops, reindex)
 
     def remove_deck(self, name):
-        st = shelve.open(self.name, writeback=True)
-        del st[name]
+        self._write([("remove", name)])
+
+    def _write(self, ops, reindex=True):
+        ops = self._prepare(ops, reindex)  # The slow part, done before other processes are locked out
+        with self.locked(exclusive=True):
+            self._recover()
+            self._journal(ops)
+            self._apply(ops)
+            self._clear_journal()
+
+    def _prepare(self, ops, reindex=True):
+        """Turn ("save", name, deck) into ("save", name, encoded deck, index terms, summary).
+        The terms are None if the index is left as it is"""
+        prepared = []
+        for op in ops:
+            if op[0] == "save" and len(op) == 3:  # Journals written before ops were prepared
+                deck = op[2]
+                terms = self.index.terms(deck) if reindex else None
+                op = ("save", op[1], self.encode(deck), terms, self.summary_of(deck))
+            prepared.append(op)
+        return prepared
+
+    def _journal(self, ops):
+        data = pickle.dumps(ops)
+        with open(self.journal_name, "ab") as f:
+            f.write(struct.pack("<II", len(data), zlib.crc32(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _journal_pending(self):
+        return os.path.exists(self.journal_name) and os.path.getsize(self.journal_name) > 0
+
+    def _recover(self):
+        """Replay every complete journal record. A torn record at the end was never committed"""
+        if os.path.exists(self.compact_marker):
+            self._finish_compaction()
+        if not self._journal_pending():
+            return
+        with open(self.journal_name, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + 8 <= len(data):
+            size, crc = struct.unpack_from("<II", data, pos)
+            record = data[pos + 8:pos + 8 + size]
+            if len(record) < size or zlib.crc32(record) != crc:
+                break
+            self._apply(self._prepare(pickle.loads(record)))
+            pos += 8 + size
+        self._clear_journal()
+
+    def _clear_journal(self):
+        with open(self.journal_name, "wb") as f:
+            os.fsync(f.fileno())
+
+    def _apply(self, ops):
+        """Apply journalled operations. Replaying them twice gives the same result"""
+        st = shelve.open(self.name)
+        for op in ops:
+            if op[0] == "save":
+                st[op[1]] = op[2]
+            else:
+                st.pop(op[1], None)
+        # If every stored deck is indexed below, the index is complete; true of any store
+        # written only by this version
+        complete = set(st.keys()) <= {op[1] for op in ops if op[0] == "save" and op[3] is not None}
         st.close()
+        self._sync(self.name)
+        for op in ops:
+            if op[0] == "save":
+                if op[3] is not None:
+                    self.index.update_deck(op[1], op[3])
+                self._store_summary(op[1], op[4])
+            else:
+                self.index.remove_deck(op[1])
+                self._drop_summary(op[1])
+        if complete:
+            self.index.mark_built()
+        self._sync(self.summary_name)
+
+    dbm_suffixes = ("", ".db", ".dat", ".dir", ".bak")  # Files dbm.gnu, dbm.ndbm and dbm.dumb create
+
+    def compact(self):
+        """Rewrite the shelves and the index to reclaim the space left by removed and renamed
+        decks. Decks are re-encoded with the current compression on the way"""
+        with self.locked(exclusive=True):
+            self._recover()
+            for name in (self.name, self.summary_name):
+                old = shelve.open(name)
+                new = shelve.open(name + ".compact", "n")
+                for key in old.keys():
+                    if name == self.name:
+                        new[key] = self.encode(self.decode(old[key]))
+                    else:
+                        new[key] = old[key]
+                old.close()
+                new.close()
+                self._sync(name + ".compact")
+            # Once the marker exists the compacted copies are complete and replace the originals,
+            # even if we crash while renaming. It lists which files the copies are made of
+            created = [s for s in self.dbm_suffixes if os.path.exists(self.name + ".compact" + s)]
+            with open(self.compact_marker, "wb") as f:
+                pickle.dump(created, f)
+                f.flush()
+                os.fsync(f.fileno())
+            self._finish_compaction()
+            self.index.compact()
+
+    def _finish_compaction(self):
+        with open(self.compact_marker, "rb") as f:
+            created = pickle.load(f)
+        for name in (self.name, self.summary_name):
+            for suffix in self.dbm_suffixes:
+                if suffix in created:
+                    if os.path.exists(name + ".compact" + suffix):
+                        os.replace(name + ".compact" + suffix, name + suffix)
+                elif os.path.exists(name + suffix):
+                    os.remove(name + suffix)
+        os.remove(self.compact_marker)
+
+    def _sync(self, name):
+        """fsync the files of a shelve, whichever dbm module created them"""
+        for suffix in self.dbm_suffixes:
+            if os.path.exists(name + suffix):
+                with open(name + suffix, "rb+") as f:
+                    os.fsync(f.fileno())
+
+    def summarize(self, name, deck=None):
+        """Store and return the small summary the Decks tab shows for a deck"""
+        if deck is None:
+            deck = self.access_deck(name)
+        summary = self.summary_of(deck)
+        with self.locked(exclusive=True):
+            return self._store_summary(name, summary)
+
+    summary_keys = {"total", "due", "due_days", "stats"}  # What summary_of() stores
+
+    def summary_current(self, summary):
+        """False for a missing summary, or one stored by a version that kept less"""
+        return summary is not None and self.summary_keys <= summary.keys()
+
+    def summary_of(self, deck):
+        return {"total": deck.check_total_size(), "due": len(deck.due_repetitions),
+                "due_days": dict(deck.buckets()), "stats": deck.statistics()}
+
+    def _store_summary(self, name, summary):
+        st = shelve.open(self.summary_name)
+        st[name] = summary
+        st.close()
+        return summary
+
+    def forget_summary(self, name):
+        with self.locked(exclusive=True):
+            self._drop_summary(name)
+
+    def _drop_summary(self, name):
+        st = shelve.open(self.summary_name)
+        st.pop(name, None)
+        st.close()
+
+    def summaries(self):
+        with self.reading():
+            st = read_shelf(self.summary_name)
+            temp = dict(st)
+            st.close()
+        return temp
+
+    def rebuild_index(self):
+        """Index every stored deck. Needed once for stores saved before the index existed"""
+        with self.locked(exclusive=True):
+            st = shelve.open(self.name)
+            for name in st.keys():
+                self.index.update_deck(name, self.index.terms(self.decode(st[name])))
+            st.close()
+            self.index.mark_built()
+
+    def _ensure_index(self):
+        if not self.index_checked:
+            with self.reading():
+                built = self.index.is_built()
+            if not built:
+                self.rebuild_index()
+            self.index_checked = True
+
+    def find_text(self, text):
+        """Return the names of the decks containing a card with 'text' on either side"""
+        self._ensure_index()
+        with self.reading():
+            return list(self.index.lookup(text))
+
+    def find_card(self, l1, l2):
+        """Return the names of the decks that already contain the card l1/l2"""
+        self._ensure_index()
+        cid = card_id(l1, l2)
+        with self.reading():
+            entry = self.index.lookup(l1)
+        return [name for name, ids in entry.items() if cid in ids]
 
     '''Might need to add a bunch of checks to run at start of entire program and at end of entire program.'''
 
 
-storage = DeckFile()
-application = MainWindow()
-application.app.mainloop()
+def benchmark_startup(runs=5):
+    """Print how long the main window takes to appear and how long until every deck is listed"""
+    global application
+    for run in range(runs):
+        application = MainWindow()
+        while application.first_paint is None:
+            application.app.update()
+        while not application.decks.refreshed:  # Every stored deck has been re-summarized
+            application.app.update()
+        names = application.decks.rows
+        loaded = time.perf_counter() - application.started
+        print(f"run {run}: first paint {application.first_paint * 1000:.1f} ms, "
+              f"all {len(names)} decks listed {loaded * 1000:.1f} ms")
+        application.app.destroy()
+
+
+def benchmark_storage():
+    """Print the stored size and load time of every deck for each available compression"""
+    st = shelve.open(storage.name)
+    decks = [storage.decode(st[name]) for name in st.keys()]
+    st.close()
+    for compression in codecs:
+        for level in ((0,) if compression == "none" else (1, 6, 9)):
+            store = DeckFile(compression, level)
+            start = time.perf_counter()
+            blobs = [store.encode(deck) for deck in decks]
+            saved = time.perf_counter() - start
+            start = time.perf_counter()
+            for blob in blobs:
+                store.decode(blob)
+            loaded = time.perf_counter() - start
+            print(f"{compression} level {level}: {sum(len(b) for b in blobs)} bytes, "
+                  f"encode {saved * 1000:.1f} ms, load {loaded * 1000:.1f} ms for {len(decks)} decks")
+
+
+if __name__ == "__main__":
+    storage = DeckFile()
+    if "--bench-startup" in sys.argv:
+        benchmark_startup()
+    elif "--bench-storage" in sys.argv:
+        benchmark_storage()
+    elif "--compact" in sys.argv:
+        storage.compact()
+    else:
+        application = MainWindow()
+        application.app.mainloop()
 